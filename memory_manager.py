@@ -1,86 +1,441 @@
+import functools
+import logging
 import sys
 import threading
+import weakref
+from array import array
+
+logger = logging.getLogger(__name__)
+
+class _LedgerState:
+    """One thread's reference count deltas waiting to be applied by RefCounter.flush().
+
+    Each delta lives in a [delta, obj] cell so the most recently touched one can
+    be cached and bumped without a dict lookup. The cell also keeps a weakly
+    tracked object alive until flush() has settled its count, so an object
+    decremented to zero is still around to be pooled. flush() drains every thread's
+    ledger, and a += on a cell is several bytecodes, so updates and drains go
+    through the ledger's own lock; it is uncontended outside a flush.
+    """
+    __slots__ = ('pending', 'last_id', 'last_cell', 'lock', 'retired')
 
-class RefCounter:
     def __init__(self):
-        self.references = {}      # Store reference counts keyed by object id
-        self.objects = {}         # Store actual objects keyed by object id
-        self.memory_pool = []     # Pool of reusable objects
+        self.pending = {}       # Object id -> [delta, obj]
+        self.last_id = None     # One-entry inline cache: last object id touched...
+        self.last_cell = None   # ...and its delta cell in pending
+        self.lock = threading.Lock()
+        self.retired = False    # Set once the owning thread has exited
+
+    def reset(self):
+        self.pending = {}
+        self.last_id = self.last_cell = None
+
+class _ThreadExit:
+    """Sentinel held only by a thread's local storage, so it dies when the thread exits."""
+    __slots__ = ('__weakref__',)
+
+class _Ledger(threading.local):
+    """Per-thread handle on a _LedgerState registered with its RefCounter."""
+    def __init__(self, manager_ref):
+        self.state = _LedgerState()
+        self.sentinel = _ThreadExit()
+        manager = manager_ref()
+        if manager is not None:
+            manager._ledgers.append(self.state)
+        # Hand whatever the thread left queued to the manager when it exits
+        weakref.finalize(self.sentinel, _retire_ledger, manager_ref, self.state).atexit = False
+
+def _retire_ledger(manager_ref, state):
+    """Thread-exit finalizer: mark the ledger retired and flush it if the manager is idle."""
+    state.retired = True
+    manager = manager_ref()
+    if manager is not None:
+        manager._flush_retired()
+
+class FreeList:
+    """Stack of pooled (object, size) entries, most recently pushed last.
+
+    Each free list has its own lock, so a pop can check an entry's size and
+    take it in one step without involving the manager lock.
+    """
+    def __init__(self):
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+
+    def pop(self, min_size=0):
+        """Remove and return the most recently pushed entry holding at least min_size bytes, or None."""
+        with self.lock:
+            entries = self.entries
+            for i in range(len(entries) - 1, -1, -1):
+                if entries[i][1] >= min_size:
+                    return entries.pop(i)
+            return None
+
+class _StrongRef:
+    """Stand-in for weakref.ref on objects that do not support weak references."""
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __call__(self):
+        return self.obj
+
+class RefCounter:
+    __slots__ = ('_counts', '_slot_of', '_free_slots', 'objects', 'memory_pool', '_bucket_limit',
+                 'lock', 'memory_usage', 'debug', '_tls', '_ledgers', '_collected', '_subtypes', '__weakref__')
+
+    def __init__(self, debug=False):
+        self._counts = array('q')  # Reference counts, one contiguous int64 slot per object
+        self._slot_of = {}        # Object id -> slot in _counts
+        self._free_slots = []     # Slots of dropped objects, reused by allocate
+        self.objects = {}         # Store (reference, size) keyed by object id
+        self.memory_pool = {}     # Free-list stacks of reusable objects keyed by (type, size bucket)
+        self._bucket_limit = 0    # One past the largest size bucket in memory_pool
         self.lock = threading.Lock()  # For thread safety
         self.memory_usage = 0     # Track memory usage
+        self.debug = debug        # Log queued ref count updates too
+        self._ledgers = []        # _LedgerState of every thread that has queued changes
+        self._tls = _Ledger(weakref.ref(self))  # This thread's ledger, registered in _ledgers
+        self._collected = []      # (id, ref) of allocated objects that were garbage collected
+        self._subtypes = {}       # desired_type -> pooled types matching it, built lazily by reuse
 
     def allocate(self, obj):
         """Allocate memory for an object and initialize reference count."""
-        obj_id = id(obj)
+        obj_size = sys.getsizeof(obj)
         with self.lock:
-            # Track memory usage
-            obj_size = sys.getsizeof(obj)
-            self.memory_usage += obj_size
-
-            # Store reference and object
-            self.references[obj_id] = 1
-            self.objects[obj_id] = obj
-            print(f"Allocated object with ID {obj_id}: {obj} with ref count {self.references[obj_id]}, size: {obj_size} bytes")
+            self._allocate_locked(obj, obj_size)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Allocated object with ID {id(obj)}: {obj} with ref count 1, size: {obj_size} bytes")
 
     def increase_ref(self, obj):
-        """Increase reference count for an object."""
+        """Increase reference count for an object.
+
+        The change is queued in the calling thread's ledger and applied by the next flush() on any thread.
+        """
         obj_id = id(obj)
-        with self.lock:
-            if obj_id in self.references:
-                self.references[obj_id] += 1
-                print(f"Increased ref count for object ID {obj_id} to {self.references[obj_id]}")
+        ledger = self._tls.state
+        with ledger.lock:
+            if obj_id == ledger.last_id:
+                cell = ledger.last_cell
+            elif obj_id in self._slot_of:
+                cell = self._ledger_cell(ledger, obj_id, obj)
             else:
-                print(f"Object {obj} not allocated.")
+                cell = None
+            if cell is not None:
+                cell[0] += 1
+                queued = cell[0]
+        if cell is None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Object {obj} not allocated.")
+        elif self.debug and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Queued ref count increase for object ID {obj_id} ({queued:+d} pending)")
 
     def decrease_ref(self, obj):
-        """Decrease reference count for an object; drop if count reaches zero."""
+        """Decrease reference count for an object; drop if count reaches zero.
+
+        The change is queued in the calling thread's ledger; flush() applies it
+        and performs the drop.
+        """
         obj_id = id(obj)
+        ledger = self._tls.state
+        with ledger.lock:
+            if obj_id == ledger.last_id:
+                cell = ledger.last_cell
+            elif obj_id in self._slot_of:
+                cell = self._ledger_cell(ledger, obj_id, obj)
+            else:
+                cell = None
+            if cell is not None:
+                cell[0] -= 1
+                queued = cell[0]
+        if cell is None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Object {obj} not allocated.")
+        elif self.debug and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Queued ref count decrease for object ID {obj_id} ({queued:+d} pending)")
+
+    def allocate_batch(self, objs):
+        """Allocate several objects under a single lock acquisition."""
+        sized = [(obj, sys.getsizeof(obj)) for obj in objs]
         with self.lock:
-            if obj_id in self.references:
-                self.references[obj_id] -= 1
-                print(f"Decreased ref count for object ID {obj_id} to {self.references[obj_id]}")
+            for obj, obj_size in sized:
+                self._allocate_locked(obj, obj_size)
+        if logger.isEnabledFor(logging.DEBUG):
+            for obj, obj_size in sized:
+                logger.debug(f"Allocated object with ID {id(obj)}: {obj} with ref count 1, size: {obj_size} bytes")
 
-                if self.references[obj_id] == 0:
-                    self.drop(obj)
-            else:
-                print(f"Object {obj} not allocated.")
+    def flush(self):
+        """Apply every thread's queued ref count changes in one lock acquisition.
+
+        All ledgers are drained before any count is checked, so an object is
+        only dropped when its references from every thread net out to zero.
+        Objects that were garbage collected while still allocated are forgotten.
+        """
+        if not self._collected and not any(state.pending for state in list(self._ledgers)):
+            return
+        with self.lock:
+            flushed, released = self._flush_locked()
+        self._log_flush(flushed, released)
+
+    def _flush_retired(self):
+        """Flush after a thread exits, unless the lock is busy; the next flush() then covers it."""
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            flushed, released = self._flush_locked()
+        finally:
+            self.lock.release()
+        self._log_flush(flushed, released)
+
+    def _flush_locked(self):
+        """Drain all ledgers and drop unreferenced objects. The caller must hold the lock.
+
+        Returns the number of objects whose counts changed and the (object, size)
+        pairs that were dropped.
+        """
+        while self._collected:
+            obj_id, ref = self._collected.pop()
+            entry = self.objects.get(obj_id)
+            # The id may already belong to a newer allocation
+            if entry is not None and entry[0] is ref:
+                del self.objects[obj_id]
+                self._free_slots.append(self._slot_of.pop(obj_id))
+                self.memory_usage -= entry[1]
+
+        touched = {}
+        for state in list(self._ledgers):
+            retired = state.retired  # Read first: a live thread may still queue after the swap
+            with state.lock:
+                pending = state.pending
+                if pending:
+                    state.reset()
+            if retired:
+                self._ledgers.remove(state)
+            for obj_id, (delta, obj) in pending.items():
+                slot = self._slot_of.get(obj_id)
+                if slot is not None:
+                    self._counts[slot] += delta
+                    touched[obj_id] = slot, obj
+
+        released = []
+        for obj_id, (slot, obj) in touched.items():
+            if self._counts[slot] <= 0:
+                # Inlined _drop_locked: the id, slot and object are already at hand
+                obj_size = self.objects.pop(obj_id)[1]
+                del self._slot_of[obj_id]
+                self._free_slots.append(slot)
+                self.memory_usage -= obj_size
+                self._pool_locked(obj, obj_size)
+                released.append((obj, obj_size))
+        return len(touched), released
+
+    def _log_flush(self, flushed, released):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Flushed ref count changes for {flushed} objects")
+            for obj, obj_size in released:
+                logger.debug(f"Dropped object with ID {id(obj)} of size {obj_size} bytes")
 
     def drop(self, obj):
         """Drop the object and add it to the memory pool for reuse, if size matches."""
-        obj_id = id(obj)
+        self._discard_pending(id(obj))
         with self.lock:
-            if obj_id in self.references:
-                obj_size = sys.getsizeof(obj)
-                print(f"Dropping object with ID {obj_id} of size {obj_size} bytes")
-                
-                # Adjust memory usage
-                self.memory_usage -= obj_size
-                del self.references[obj_id]
-                del self.objects[obj_id]
-                self.memory_pool.append((obj_size, obj))
+            obj_size = self._drop_locked(obj)
+        if obj_size is not None and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Dropped object with ID {id(obj)} of size {obj_size} bytes")
 
-    def reuse(self, desired_type=None, min_size=0):
-        """Reuse an object from the memory pool if available and matches criteria."""
+    def drop_batch(self, objs):
+        """Drop several objects into the memory pool under a single lock acquisition."""
+        objs = list(objs)
+        self._discard_pending(*map(id, objs))
+        dropped = []
         with self.lock:
-            for i, (obj_size, obj) in enumerate(self.memory_pool):
-                if (desired_type is None or isinstance(obj, desired_type)) and obj_size >= min_size:
-                    self.memory_pool.pop(i)
-                    obj_id = id(obj)
-                    self.allocate(obj)
-                    print(f"Reused object: {obj} with ID {obj_id}, size: {obj_size} bytes")
-                    return obj
-            print("No suitable objects available for reuse.")
+            for obj in objs:
+                obj_size = self._drop_locked(obj)
+                if obj_size is not None:
+                    dropped.append((obj, obj_size))
+        if logger.isEnabledFor(logging.DEBUG):
+            for obj, obj_size in dropped:
+                logger.debug(f"Dropped object with ID {id(obj)} of size {obj_size} bytes")
+
+    def reuse(self, desired_type=None, min_size=0):
+        """Reuse an object from the memory pool if available and matches criteria.
+
+        Objects of desired_type or a subclass match. The smallest size bucket
+        that fits min_size wins; within a bucket the exact type is tried before
+        subclasses, and the most recently dropped object first.
+        """
+        self.flush()
+        entry = self._pop_pool(desired_type, min_size)
+        if entry is None:
+            logger.debug("No suitable objects available for reuse.")
             return None
+        with self.lock:
+            self._allocate_locked(*entry)
+        reused, obj_size = entry
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Reused object: {reused} with ID {id(reused)}, size: {obj_size} bytes")
+        return reused
 
-    def get_memory_usage(self):
-        """Get the current memory usage."""
+    def reuse_batch(self, count, desired_type=None, min_size=0):
+        """Reuse up to count objects from the memory pool, registering them under a single lock acquisition."""
+        self.flush()
+        reused = []
+        while len(reused) < count:
+            entry = self._pop_pool(desired_type, min_size)
+            if entry is None:
+                break
+            reused.append(entry)
         with self.lock:
-            print(f"Current memory usage: {self.memory_usage} bytes")
-            return self.memory_usage
+            for entry in reused:
+                self._allocate_locked(*entry)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Reused {len(reused)} of {count} requested objects")
+        return [obj for obj, _ in reused]
+
+    def get_memory_usage(self):
+        """Get the current memory usage.
+
+        The counter is read without taking the lock (an int attribute read is
+        atomic under the GIL), so it may miss an update that is in flight on
+        another thread. Only flushing the queued changes locks.
+        """
+        self.flush()
+        memory_usage = self.memory_usage
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Current memory usage: {memory_usage} bytes")
+        return memory_usage
+
+    def _allocate_locked(self, obj, obj_size):
+        """Register obj with a ref count of 1. The caller must hold the lock."""
+        obj_id = id(obj)
+        # The id may still map to a collected object whose weakref callback has
+        # not been processed yet; replace it rather than counting both
+        old_entry = self.objects.get(obj_id)
+        if old_entry is not None:
+            self.memory_usage -= old_entry[1]
+            self._discard_pending(obj_id)
+        self.memory_usage += obj_size
+
+        # Give the object a slot in the count array, recycling freed slots first
+        slot = self._slot_of.get(obj_id)
+        if slot is None:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = len(self._counts)
+                self._counts.append(0)
+            self._slot_of[obj_id] = slot
+        self._counts[slot] = 1
+
+        # Store reference and object along with its size, computed only once
+        self.objects[obj_id] = (self._track(obj, obj_id), obj_size)
+
+    def _drop_locked(self, obj):
+        """Move obj into the memory pool and return its size, or None if it was not allocated.
+
+        The caller must hold the lock.
+        """
+        obj_id = id(obj)
+        if obj_id not in self._slot_of:
+            return None
+        obj_size = self.objects.pop(obj_id)[1]
+
+        # Adjust memory usage
+        self.memory_usage -= obj_size
+        self._free_slots.append(self._slot_of.pop(obj_id))
+        self._pool_locked(obj, obj_size)
+        return obj_size
+
+    def _pool_locked(self, obj, obj_size):
+        """Push a dropped object onto its memory pool bucket. The caller must hold the lock."""
+        key = (type(obj), self._size_category(obj_size))
+        pool = self.memory_pool.get(key)
+        if pool is None:
+            pool = self.memory_pool[key] = FreeList()
+            self._bucket_limit = max(self._bucket_limit, key[1] + 1)
+            self._subtypes = {}  # Cached subtype lists may be missing the new type
+        pool.push((obj, obj_size))
+
+    def _pop_pool(self, desired_type, min_size):
+        """Pop the tightest-fitting matching (object, size) entry from the pool, or return None.
+
+        Does not take the manager lock: pool buckets are only ever added under it,
+        and each FreeList serializes its own pushes and pops.
+        """
+        types = self._pooled_subtypes(object if desired_type is None else desired_type)
+        if not types:
+            return None
+        # Smallest bucket first, so a small request never takes a large object
+        # while a smaller one of another matching type is available
+        for category_size in range(self._size_category(min_size), self._bucket_limit):
+            for obj_type in types:
+                pool = self.memory_pool.get((obj_type, category_size))
+                if pool:
+                    entry = pool.pop(min_size)
+                    if entry is not None:
+                        return entry
+        return None
+
+    def _pooled_subtypes(self, desired_type):
+        """Return the pooled types whose objects are instances of desired_type, exact type first."""
+        cache = self._subtypes
+        types = cache.get(desired_type)
+        if types is None:
+            pooled = {obj_type for obj_type, _ in list(self.memory_pool)}
+            subtypes = [obj_type for obj_type in pooled
+                        if obj_type is not desired_type and issubclass(obj_type, desired_type)]
+            types = cache[desired_type] = ((desired_type,) if desired_type in pooled else ()) + tuple(subtypes)
+        return types
+
+    def _ledger_cell(self, ledger, obj_id, obj):
+        """Return obj_id's delta cell in the ledger and make it the inline-cache entry."""
+        cell = ledger.pending.get(obj_id)
+        if cell is None:
+            cell = ledger.pending[obj_id] = [0, obj]
+        ledger.last_id = obj_id
+        ledger.last_cell = cell
+        return cell
+
+    def _discard_pending(self, *obj_ids):
+        """Forget every thread's queued changes for object ids that are being dropped or replaced."""
+        for ledger in list(self._ledgers):
+            with ledger.lock:
+                for obj_id in obj_ids:
+                    ledger.pending.pop(obj_id, None)
+                    if ledger.last_id == obj_id:
+                        ledger.last_id = ledger.last_cell = None
+
+    def _track(self, obj, obj_id):
+        """Reference obj weakly so the manager does not keep allocated objects alive.
+
+        Queued ledger deltas still hold obj strongly until the next flush().
+        """
+        try:
+            return weakref.ref(obj, functools.partial(self._on_collect, obj_id))
+        except TypeError:
+            # Builtins such as dict and list cannot be weakly referenced
+            return _StrongRef(obj)
+
+    def _on_collect(self, obj_id, ref):
+        """Weakref callback; may run while the lock is held, so defer the cleanup to flush()."""
+        self._collected.append((obj_id, ref))
+
+    def _size_category(self, size):
+        """Map a size to its power-of-two bucket (bucket n holds sizes up to 2**n bytes)."""
+        return max(size - 1, 0).bit_length()
 
 # Usage Example
 if __name__ == "__main__":
-    manager = RefCounter()
+    logging.basicConfig(level=logging.DEBUG, format="%(message)s")
+    manager = RefCounter(debug=True)
 
     # Allocate an object
     obj1 = {"data": "example"}
@@ -100,3 +455,9 @@ if __name__ == "__main__":
     reused_obj = manager.reuse(desired_type=dict, min_size=50)  # Specify type and size requirements
     manager.get_memory_usage()
 
+    # Allocate, drop and reuse several objects with one lock acquisition per call
+    batch = [[i] for i in range(3)]
+    manager.allocate_batch(batch)
+    manager.drop_batch(batch)
+    reused_batch = manager.reuse_batch(len(batch), desired_type=list)
+    manager.get_memory_usage()
@@ -0,0 +1,183 @@
+import sys
+import threading
+import unittest
+from collections import OrderedDict
+
+import memory_manager
+import memroy_manager
+
+
+class Node:
+    """Weakly referenceable object, unlike the builtins used elsewhere."""
+
+
+class SubList(list):
+    pass
+
+
+class RefCounterTests:
+    module = None
+
+    def setUp(self):
+        self.manager = self.module.RefCounter()
+
+    def run_in_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.start()
+        thread.join()
+
+    def test_cross_thread_increase_keeps_object_alive(self):
+        obj = {"data": "example"}
+        self.manager.allocate(obj)
+        queued = threading.Event()
+        release = threading.Event()
+
+        def worker():
+            self.manager.increase_ref(obj)  # Queued, never flushed by this thread
+            queued.set()
+            release.wait()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        try:
+            queued.wait()
+            self.manager.decrease_ref(obj)
+            self.manager.flush()
+            self.assertIsNone(self.manager.reuse(dict))
+            self.assertEqual(self.manager.get_memory_usage(), sys.getsizeof(obj))
+        finally:
+            release.set()
+            thread.join()
+
+        self.manager.decrease_ref(obj)
+        self.assertIs(self.manager.reuse(dict), obj)
+
+    def test_thread_exit_flushes_queued_changes(self):
+        obj = {"data": "example"}
+        self.manager.allocate(obj)
+        self.run_in_thread(self.manager.decrease_ref, obj)
+        # Nothing has flushed yet: only the exiting thread's finalizer can have applied the change
+        self.assertEqual(self.manager.memory_usage, 0)
+        self.assertEqual(len(self.manager._ledgers), 1)
+        self.assertIs(self.manager.reuse(dict), obj)
+
+    def test_concurrent_updates_are_not_lost(self):
+        obj = {"data": "example"}
+        self.manager.allocate(obj)
+
+        def worker():
+            for _ in range(1000):
+                self.manager.increase_ref(obj)
+                self.manager.decrease_ref(obj)
+            self.manager.flush()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.manager.get_memory_usage(), sys.getsizeof(obj))
+        self.manager.decrease_ref(obj)
+        self.assertEqual(self.manager.get_memory_usage(), 0)
+
+    def test_concurrent_reuse_hands_out_each_object_once(self):
+        objs = [[i] for i in range(200)]
+        self.manager.allocate_batch(objs)
+        self.manager.drop_batch(objs)
+        reused = []
+
+        def worker():
+            while (obj := self.manager.reuse(list, min_size=sys.getsizeof(objs[0]))) is not None:
+                reused.append(obj)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(map(id, reused)), sorted(map(id, objs)))
+
+    def test_reuse_prefers_the_smallest_fitting_object(self):
+        small, large = [None], [None] * 100
+        self.manager.allocate_batch([small, large])
+        self.manager.drop_batch([small, large])  # large is the most recently pooled
+        self.assertIs(self.manager.reuse(list, min_size=sys.getsizeof(small)), small)
+        self.assertIs(self.manager.reuse(list), large)
+
+    def test_reuse_prefers_a_smaller_subclass_over_a_larger_exact_type(self):
+        small_sub, small, large = SubList(), [None] * 2, [None] * 100
+        self.assertEqual(self.manager._size_category(sys.getsizeof(small_sub)),
+                         self.manager._size_category(sys.getsizeof(small)))
+        self.manager.allocate_batch([large, small_sub])
+        self.manager.drop_batch([large, small_sub])
+        self.assertIs(self.manager.reuse(list), small_sub)
+
+        # Within one bucket the exact type wins, even if pushed earlier
+        self.manager.allocate_batch([small, small_sub])
+        self.manager.drop_batch([small, small_sub])
+        self.assertIs(self.manager.reuse(list), small)
+        self.assertIs(self.manager.reuse(list), small_sub)
+        self.assertIs(self.manager.reuse(list), large)
+
+    def test_reuse_searches_below_the_top_of_a_bucket(self):
+        large, small = [None] * 3, [None] * 2
+        self.assertEqual(self.manager._size_category(sys.getsizeof(large)),
+                         self.manager._size_category(sys.getsizeof(small)))
+        self.manager.allocate_batch([large, small])
+        self.manager.drop_batch([large, small])
+        self.assertIs(self.manager.reuse(list, min_size=sys.getsizeof(large)), large)
+        self.assertIs(self.manager.reuse(list), small)
+
+    def test_reuse_matches_pooled_subclass(self):
+        ordered = OrderedDict(data="example")
+        self.manager.allocate(ordered)
+        self.manager.drop(ordered)
+        self.assertIs(self.manager.reuse(dict), ordered)
+
+    def test_reuse_sees_subtype_pooled_after_lookup(self):
+        plain = {"data": "example"}
+        self.manager.allocate(plain)
+        self.manager.drop(plain)
+        self.assertIs(self.manager.reuse(dict), plain)  # Caches the pooled types matching dict
+
+        ordered = OrderedDict(data="example")
+        self.manager.allocate(ordered)
+        self.manager.drop(ordered)
+        self.assertIs(self.manager.reuse(dict), ordered)
+
+    def test_decref_to_zero_pools_weakly_tracked_object(self):
+        node = Node()
+        node_id = id(node)
+        self.manager.allocate(node)
+        self.manager.decrease_ref(node)
+        del node  # The queued decrement must keep it alive until flush() pools it
+        reused = self.manager.reuse(Node)
+        self.assertIsNotNone(reused)
+        self.assertEqual(id(reused), node_id)
+
+    def test_reused_id_after_collection(self):
+        old = Node()
+        old_id = id(old)
+        self.manager.allocate(old)
+        del old  # Collected while allocated; flush() has not reaped it yet
+
+        new = Node()
+        if id(new) != old_id:
+            self.skipTest("the allocator did not hand out the collected object's id")
+        self.manager.allocate(new)
+        self.assertEqual(self.manager.get_memory_usage(), sys.getsizeof(new))
+        self.manager.decrease_ref(new)
+        self.assertEqual(self.manager.get_memory_usage(), 0)
+        self.assertIs(self.manager.reuse(Node), new)
+
+
+class MemoryManagerTests(RefCounterTests, unittest.TestCase):
+    module = memory_manager
+
+
+class MemroyManagerTests(RefCounterTests, unittest.TestCase):
+    module = memroy_manager
+
+
+if __name__ == "__main__":
+    unittest.main()